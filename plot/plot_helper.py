@@ -5,8 +5,8 @@
 import json
 import math
 import matplotlib as m
+import numpy as np
 import os
-import random
 
 if os.uname()[0] == "Darwin":
     m.use("MacOSX")
@@ -18,9 +18,9 @@ def write_dummy_data():
     d = {}
     keys = ['rmse_links', 'rmse_servers', 'simulation_trace']
     for k in keys:
-        d[k] = [random.random() for n in range(100)]
+        d[k] = np.random.random_sample(100).tolist()
     f = open('dummy.metrics', 'w')
-    print >>f, json.dumps(d)
+    json.dump(d, f)
     f.close()
 
 def ewma(alpha, values):
@@ -10,7 +10,7 @@ import sys
 import matplotlib.pyplot as plt
 import networkx as nx
 
-from resource_allocator import ResourceAllocator
+from resource_allocator import FlowTable, ResourceAllocator
 
 logger = logging.getLogger(__name__)
 
@@ -28,14 +28,14 @@ class Controller(ResourceAllocator):
         name: string representation, should be unique in a simulation
         mylinks: a list of links in the self.graph which are goverend by
         this controller, inferred from switches
-        active_flows: used to track the (timeout, path) of all active flows
+        active_flows: FlowTable tracking the (timeout, path) of all active flows
         """
         self.switches = sw
         self.servers = srv
         self.graph = graph
         self.name = name
 
-        self.active_flows = []
+        self.active_flows = FlowTable()
         # Inferred from graph
         self.localservers = []
         self.mylinks = []
@@ -65,6 +65,9 @@ class LinkBalancerCtrl(Controller):
     switches, and decides how to map requests such to minimize the maximum link
     utilization over all visible links
     """
+    # Cache of static shortest paths, valid for the graph in _path_graph
+    _path_graph = None
+    _path_cache = None
 
     def __init__(self, *args, **kwargs):
         """Reuse __init__ of our superclass"""
@@ -175,10 +178,27 @@ class LinkBalancerCtrl(Controller):
         assert len(avail_srvs)> 0
 
         for server in avail_srvs:
-            paths.append(nx.shortest_path(graph, server, sw))
+            paths.append(self._shortest_path(graph, server, sw))
 
         return paths
 
+    def _shortest_path(self, graph, server, sw):
+        """
+        Return the shortest path from server to sw. Routing is static, so
+        paths over our own graph are computed once and then looked up
+        """
+        if graph is not self.graph:
+            return nx.shortest_path(graph, server, sw)
+        if self._path_graph is not graph:
+            # First lookup, or our graph was replaced since
+            self._path_graph = graph
+            self._path_cache = {}
+        path = self._path_cache.get((server, sw))
+        if path is None:
+            path = nx.shortest_path(graph, server, sw)
+            self._path_cache[(server, sw)] = path
+        return path
+
 
     def compute_path_metric(self, sw, path, util, time_now):
         """
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+'''Numeric kernels of the simulator, compiled with Numba when available
+
+Numba is optional: without it, every kernel falls back to an equivalent
+NumPy or pure Python implementation.'''
+
+from math import pi, sin
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+if HAVE_NUMBA:
+    @njit(cache=True)
+    def weighted_rmse(used, capacity):
+        """
+        Return the root of the summed squared deviation of each link's
+        utilization from its share of the total, split by capacity
+        used, capacity: float64 arrays, one element per link
+        """
+        used_total = 0.0
+        cap_total = 0.0
+        for i in range(used.shape[0]):
+            used_total += used[i]
+            cap_total += capacity[i]
+        total = 0.0
+        for i in range(used.shape[0]):
+            diff = used[i] - (used_total / cap_total) * capacity[i]
+            total += diff * diff
+        return np.sqrt(total)
+else:
+    def weighted_rmse(used, capacity):
+        """
+        Return the root of the summed squared deviation of each link's
+        utilization from its share of the total, split by capacity
+        used, capacity: float64 arrays, one element per link
+        """
+        opt_used = (used.sum() / capacity.sum()) * capacity
+        return np.sqrt(((used - opt_used) ** 2).sum())
+
+
+if HAVE_NUMBA:
+    @njit(cache=True)
+    def sawtooth_jit(t, period, offset, max_demand, y_shift=0.0):
+        """Compiled sawtooth(t, period, offset, max_demand, y_shift)
+
+        Arguments are promoted to float64 by the arithmetic, so no float()
+        casts are needed to stay in nopython mode
+        """
+        phase = (t + offset) % period
+        rising = min(phase, period - phase)
+        return rising / (period * 0.5) * max_demand + (y_shift * max_demand)
+
+    @njit(cache=True)
+    def wave_jit(t, period, offset, max_demand, y_shift=0.0):
+        """Compiled wave(t, period, offset, max_demand, y_shift)
+
+        Arguments are promoted to float64 as in sawtooth_jit
+        """
+        phase_unitless = (t + offset - (period * 0.25)) % period
+        phase_radians = phase_unitless / period * (2.0 * pi)
+        raw_val = (sin(phase_radians) + 1.0) * 0.5
+        return (raw_val * max_demand) + (y_shift * max_demand)
+else:
+    from sim.workload import sawtooth as sawtooth_jit
+    from sim.workload import wave as wave_jit
+
+
+if HAVE_NUMBA:
+    @njit(parallel=True, cache=True)
+    def compute_demands(switch_params, ts):
+        """
+        Return the sawtooth demand of each switch at each timestep, computed
+        for all switches in parallel
+        switch_params: (switches, 3) float64 array with rows of (period,
+        offset, max_demand)
+        ts: float64 array of timesteps
+        returns: (switches, timesteps) float64 array, whose row i equals
+        sawtooth_array(ts, *switch_params[i])
+        """
+        out = np.empty((switch_params.shape[0], ts.shape[0]))
+        for i in prange(switch_params.shape[0]):
+            period = switch_params[i, 0]
+            offset = switch_params[i, 1]
+            max_demand = switch_params[i, 2]
+            half = period * 0.5
+            for j in range(ts.shape[0]):
+                phase = (ts[j] + offset) % period
+                out[i, j] = min(phase, period - phase) / half * max_demand
+        return out
+else:
+    def compute_demands(switch_params, ts):
+        """
+        Return the sawtooth demand of each switch at each timestep
+        switch_params: (switches, 3) float64 array with rows of (period,
+        offset, max_demand)
+        ts: float64 array of timesteps
+        returns: (switches, timesteps) float64 array, whose row i equals
+        sawtooth_array(ts, *switch_params[i])
+        """
+        from sim.workload import sawtooth_array
+        out = np.empty((switch_params.shape[0], ts.shape[0]))
+        for i, (period, offset, max_demand) in enumerate(switch_params):
+            out[i] = sawtooth_array(ts, period, offset, max_demand)
+        return out
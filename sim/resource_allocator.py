@@ -3,12 +3,122 @@
 # Dan Levin <dlevin@net.t-labs.tu-berlin.de>
 # Brandon Heller <brandonh@stanford.edu>
 
+from collections import defaultdict
 import heapq
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+class FastEdgeStore(object):
+    """
+    Flat, integer-indexed view of the edges of a static topology, so that hot
+    loops avoid walking graph[u][v] through NetworkX's nested dicts
+
+    edges: list of each edge (u, v), ordered by edge id, which is the order
+    of graph.edges()
+    idx: mapping of each edge (u, v) to its edge id
+    attrs: the graph's own edge attribute dicts, ordered by edge id. They are
+    shared with the graph, so writes made through either one are seen by both
+    capacity: NumPy array of link capacities, ordered by edge id
+    """
+    def __init__(self, graph):
+        self.edges = []
+        self.idx = {}
+        self.attrs = []
+        for i, (u, v, attrs) in enumerate(graph.edges(data=True)):
+            self.edges.append((u, v))
+            self.idx[(u, v)] = i
+            self.attrs.append(attrs)
+        self.capacity = np.array([a['capacity'] for a in self.attrs],
+                                 dtype=np.float64)
+        # Paths are static once routing is known, so are their attribute dicts
+        self._path_attrs = {}
+
+    def path_attrs(self, path):
+        """Return the edge attribute dicts along path"""
+        key = tuple(path)
+        attrs = self._path_attrs.get(key)
+        if attrs is None:
+            attrs = [self.attrs[self.idx[link]]
+                     for link in zip(path[:-1], path[1:])]
+            self._path_attrs[key] = attrs
+        return attrs
+
+
+class FlowTable(object):
+    """
+    Active flows, bucketed by the time at which they expire
+
+    Flows expiring at the same time share a bucket, so that releasing them
+    costs one heap operation per distinct expiry time rather than per flow.
+    Iterating yields the (whenfree, path, resources) of each flow, in no
+    particular order.
+    """
+    def __init__(self):
+        self._buckets = defaultdict(list)
+        # Heap of the distinct expiry times of the flows in _buckets
+        self._times = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for whenfree, flows in self._buckets.iteritems():
+            for path, resources in flows:
+                yield (whenfree, path, resources)
+
+    def add(self, whenfree, path, resources):
+        """Record a flow using resources along path until whenfree"""
+        bucket = self._buckets[whenfree]
+        if not bucket:
+            heapq.heappush(self._times, whenfree)
+        bucket.append((path, resources))
+        self._count += 1
+
+    def next_expiry(self):
+        """Return the earliest expiry time of any flow, None if empty"""
+        if self._times:
+            return self._times[0]
+        return None
+
+    def last_expiry(self):
+        """Return the latest expiry time of any flow, None if empty"""
+        if self._times:
+            return max(self._times)
+        return None
+
+    def pop_until(self, now):
+        """
+        Remove the flows which expire prior to- or now
+        returns: list of their (path, resources), earliest expiry first
+        """
+        expired = []
+        times = self._times
+        while times and times[0] <= now:
+            flows = self._buckets.pop(heapq.heappop(times))
+            self._count -= len(flows)
+            expired.extend(flows)
+        return expired
+
+
 class ResourceAllocator(object):
+    # Optional FastEdgeStore over self.graph, set by subclasses which own a
+    # static topology
+    store = None
+
+    def _path_edges(self, path):
+        """Return the edge attribute dicts of self.graph along path"""
+        if self.store is not None:
+            return self.store.path_attrs(path)
+        edge = self.graph.edge
+        return [edge[src][dst] for src, dst in zip(path[:-1], path[1:])]
+
+    def _path_updated(self, path):
+        """Called after the utilization of the links along path changed"""
+        pass
 
     def _update_last_now(self, now):
         if hasattr(self, 'last_now'):
@@ -21,12 +131,11 @@ class ResourceAllocator(object):
         Add resources used for each link in path 
         graph: the graph to which we allocate flow resources
         whenfree: The time at which the resources should be freed
-        flowlist: A list (heapq) of paths and resource consumption to free,
-        ordered by whenfree
+        flowlist: FlowTable of paths and resource consumption to free,
+        bucketed by whenfree
         Detect if any link in a path is fully utilized, do not oversubscribe
         Record the resources for link to be freed at time <whenfree>
         """
-        graph = self.graph
         flowlist = self.active_flows
 
         assert (len(path) > 0)
@@ -34,19 +143,18 @@ class ResourceAllocator(object):
         self._update_last_now(now)
         whenfree = now + duration
 
-        links = zip(path[:-1], path[1:])
-        for src, dst in links:
-            edge = graph.edge[src][dst]
+        edges = self._path_edges(path)
+        for edge in edges:
             if (edge['used'] + resources > edge['capacity']):
                 logging.info("Not allocating [%d] at time [%d]", resources,
                              now)
                 return
 
-        for src, dst in links:
-            edge = graph.edge[src][dst]
+        for edge in edges:
             edge['used'] += resources
+        self._path_updated(path)
 
-        heapq.heappush(flowlist, (whenfree, path, resources))
+        flowlist.add(whenfree, path, resources)
 
 
     def free_resources(self, now):
@@ -56,19 +164,20 @@ class ResourceAllocator(object):
         graph: by default, free resources from the simulation graph
         flowlist: a list of active flows in the graph
         """
-        graph = self.graph
         flowlist = self.active_flows
 
-        if hasattr(self, "last_now") and self.last_now >= now and (len(flowlist) > 0 and flowlist[0][0] <= now):
-            raise AssertionError("flowlist[0][0]: %d now: %d" % (flowlist[0][0], now))
+        next_expiry = flowlist.next_expiry()
+        if hasattr(self, "last_now") and self.last_now >= now and (next_expiry is not None and next_expiry <= now):
+            raise AssertionError("next expiry: %d now: %d" % (next_expiry, now))
 
         self._update_last_now(now)
+        self._release_until(now)
 
-        while (len(flowlist) > 0 and flowlist[0][0] <= now):
-            time, path, resources = heapq.heappop(flowlist)
-            links = zip(path[:-1], path[1:])
-            for src, dst in links:
-                newutil = graph.edge[src][dst]['used'] - resources
+    def _release_until(self, now):
+        """Release the resources of all flows which expire prior to- or now"""
+        for path, resources in self.active_flows.pop_until(now):
+            for edge in self._path_edges(path):
+                newutil = edge['used'] - resources
                 # If we are properly allocating resources, we should never free
                 # more resources than were ever used
                 #assert (newutil >= 0)
@@ -76,5 +185,17 @@ class ResourceAllocator(object):
                     logging.warn("[%s] Over-freeing path [%s] to [%d] at time [%d]", 
                                  str(self), str(path), newutil, now)
 
-                graph.edge[src][dst]['used'] = max(0.0, newutil)
+                edge['used'] = max(0.0, newutil)
+            self._path_updated(path)
 
+    def drain(self):
+        """
+        Free the resources of all active flows at once, as if time advanced
+        to when the last of them expires
+        """
+        last = self.active_flows.last_expiry()
+        if last is not None:
+            self._release_until(last)
+            # Never move time backwards, e.g. when flows outlived last_now
+            if not hasattr(self, 'last_now') or self.last_now < last:
+                self.last_now = last
@@ -7,7 +7,7 @@
 from itertools import product
 import json
 import logging
-from math import sqrt
+from math import ceil, sqrt
 try:
     # OrderedDict for python>=2.7
     from collections import OrderedDict
@@ -25,9 +25,11 @@ import sys
 # 3rd party libs
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 
 # sim modules
-from sim.resource_allocator import ResourceAllocator
+from sim.jit import weighted_rmse
+from sim.resource_allocator import FastEdgeStore, FlowTable, ResourceAllocator
 from sim.workload import old_to_new
 
 def sum_grouped_by(fnc, iterable):
@@ -50,7 +52,7 @@ class Simulation(ResourceAllocator):
         switches: list of switch names
         servers: list of server names
         """
-        self.active_flows = []
+        self.active_flows = FlowTable()
         self.graph = graph
         for u, v in self.graph.edges():
             # Initialize edge utilization attribute values in graph
@@ -131,8 +133,30 @@ class LinkBalancerSim(Simulation):
     """
     def __init__(self, *args, **kwargs):
         super(LinkBalancerSim, self).__init__(*args, **kwargs)
+        # The topology is static: index its edges once. NetworkX is still
+        # used by the controllers for shortest path computation.
+        self.store = FastEdgeStore(self.graph)
+        # Per-server link utilization, kept current on every allocate/free so
+        # that rmse_servers need not walk the graph
+        self._server_slot = {}
+        server_edges = []
+        for i, server in enumerate(self.servers):
+            neighbor_sw = self.graph.neighbors(server)
+            if len(neighbor_sw) != 1:
+                raise NotImplementedError("Single server links only")
+            self._server_slot[server] = i
+            server_edges.append(self.store.idx[(server, neighbor_sw[0])])
+        self._server_edges = server_edges
+        self._server_cap = self.store.capacity[server_edges]
+        self._server_load = np.array(
+            [self.store.attrs[e]['used'] for e in server_edges],
+            dtype=np.float64)
+        # RMSE of the simulation graph, valid until the next link update
+        self._rmse_cache = {}
         self.metric_fcns = [self.rmse_links, self.rmse_servers,
                             self.state_distances, self.simulation_trace]
+        # Metrics whose per-step value is a single float
+        self.scalar_metrics = ('rmse_links', 'rmse_servers')
 
     def metrics(self, graph=None):
         """Return dict of metric names to values"""
@@ -141,6 +165,25 @@ class LinkBalancerSim(Simulation):
             m[fcn.__name__] = fcn(self, graph)
         return m
 
+    def _path_updated(self, path):
+        """Mirror the new utilization of the server links at the ends of path"""
+        self._rmse_cache.clear()
+        # Paths run from a server or towards one: refresh either endpoint
+        for node in (path[0], path[-1]):
+            i = self._server_slot.get(node)
+            if i is not None:
+                attrs = self.store.attrs[self._server_edges[i]]
+                self._server_load[i] = attrs['used']
+
+    def touch(self):
+        """
+        Resynchronize derived link state after edge attributes of self.graph
+        were written directly rather than through allocate/free_resources
+        """
+        self._rmse_cache.clear()
+        for i, e in enumerate(self._server_edges):
+            self._server_load[i] = self.store.attrs[e]['used']
+
     def rmse_links(self, graph=None, time_step=None, new_reqs=None):
         """
         Calculate RMSE over _all_ links
@@ -152,6 +195,25 @@ class LinkBalancerSim(Simulation):
         if not graph:
             graph = self.graph
 
+        if graph is self.graph:
+            # Reuse the last value until allocate/free changes a link
+            value = self._rmse_cache.get('links')
+            if value is None:
+                # Topologies are small: plain loops over the shared edge
+                # dicts beat copying them into an array on every update
+                used_total = 0.0
+                cap_total = 0.0
+                for attrs in self.store.attrs:
+                    used_total += attrs['used']
+                    cap_total += attrs['capacity']
+                total = 0.0
+                for attrs in self.store.attrs:
+                    opt_used = (used_total / cap_total) * attrs['capacity']
+                    total += (attrs['used'] - opt_used) ** 2
+                value = sqrt(total)
+                self._rmse_cache['links'] = value
+            return value
+
         # First, find total capacity and util of entire network
         used_total = 0.0
         cap_total = 0.0
@@ -180,6 +242,12 @@ class LinkBalancerSim(Simulation):
         if not graph:
             graph = self.graph
 
+        if graph is self.graph:
+            # Server links are indexed once, in __init__
+            e = self._server_edges[self._server_slot[server]]
+            attrs = self.store.attrs[e]
+            return (attrs["used"], attrs["capacity"])
+
         neighbor_sw = graph.neighbors(server)
         if len(neighbor_sw) != 1:
             raise NotImplementedError("Single server links only")
@@ -200,6 +268,14 @@ class LinkBalancerSim(Simulation):
         if not graph:
             graph = self.graph
 
+        if graph is self.graph:
+            value = self._rmse_cache.get('servers')
+            if value is None:
+                value = float(weighted_rmse(self._server_load,
+                                            self._server_cap))
+                self._rmse_cache['servers'] = value
+            return value
+
         # Assuming a proportional spread of those requests, find optimal.
         cap_total = 0.0  # total capacity of all server links
         used_total = 0.0
@@ -256,13 +332,30 @@ class LinkBalancerSim(Simulation):
             a version of self.graph from (arr_time - stalenes) will be
             presented to each controller 
         """
+        # The main loop runs once per step_size until the last arrival, which
+        # it consumes at the first step at or after it, so scalar metrics are
+        # stored into arrays preallocated for that many steps. Other metrics,
+        # and any remaining steps, are appended.
+        if len(workload) > 0:
+            steps = int(ceil(workload[-1][0] / float(step_size))) + 1
+        else:
+            steps = 0
         all_metrics = {}
+        scalar_metrics = {}
         for fcn in self.metric_fcns:
-            all_metrics[fcn.__name__] = []
+            if fcn.__name__ in self.scalar_metrics:
+                scalar_metrics[fcn.__name__] = np.empty(steps)
+            else:
+                all_metrics[fcn.__name__] = []
+        step = 0
 
         time_now = 0
         arr_time = 0
         last_sync = 0
+        # Arrivals are in time order: when even the last one comes before
+        # the first sync is due (e.g. sync_period=timesteps), never sync
+        do_sync = (sync_period != None and len(workload) > 0 and
+                   workload[-1][0] >= sync_period)
         debugcounter = 0
         # Keep a queue of stale graphs representing graph state from earlier in
         # the simulation
@@ -306,7 +399,7 @@ class LinkBalancerSim(Simulation):
 
                 # Check if sync is necessary
                 time_elapsed_since_sync = arr_time - last_sync
-                if ((sync_period != None) and time_elapsed_since_sync >= sync_period):
+                if (do_sync and time_elapsed_since_sync >= sync_period):
                     self.sync_ctrls()
                     logging.debug("[%s] %s", str(arr_time), "Synced all ctrls")
                     if sync_period > 0:
@@ -336,9 +429,16 @@ class LinkBalancerSim(Simulation):
 
             # We can now collect metrics and advance to the next timestep
             for fcn in self.metric_fcns:
-                all_metrics[fcn.__name__].append(fcn(self.graph,
-                                                     time_step=time_now,
-                                                     new_reqs=new_reqs))
+                value = fcn(self.graph, time_step=time_now, new_reqs=new_reqs)
+                values = scalar_metrics.get(fcn.__name__)
+                if values is None:
+                    all_metrics[fcn.__name__].append(value)
+                    continue
+                if step == len(values):
+                    values = np.concatenate((values, np.empty(len(values) + 1)))
+                    scalar_metrics[fcn.__name__] = values
+                values[step] = value
+            step += 1
 
                 #log_graph_status(self.graph, pos, time_now)
             if show_graph:
@@ -348,7 +448,10 @@ class LinkBalancerSim(Simulation):
             logging.debug(self.graph.edges(data=True))
 
             time_now += step_size
-            
+
+        for name, values in scalar_metrics.items():
+            all_metrics[name] = values[:step].tolist()
+
         if (ignore_remaining):
             return all_metrics
 
@@ -370,31 +473,40 @@ class LinkBalancerSim(Simulation):
 
     def run_and_trace(self, name, workload, old=False, sync_period=0,
                       step_size=1, ignore_remaining=False, show_graph=False,
-                      staleness=0):
+                      staleness=0, trace=True):
         """
         Run and produce a log of the simulation for each timestep
         Convert an old format workload to new format if old=TRUE
         
         Dump the metrics, workload, and (if old-format) the converted
-        new-format workload to JSON as files
+        new-format workload to JSON as files. With trace=False, write nothing
+        to disk and only return the metrics
         """
         filename = 'logs/' + name 
-        dir = os.path.dirname(filename)
-        try:
-                os.stat(dir)
-        except:
-                os.mkdir(dir)
-
-        f = open(filename + '.workload', 'w')
-        print >>f, json.dumps(workload,sort_keys=True, indent=4)
-        f.close()
+        if trace:
+            dir = os.path.dirname(filename)
+            try:
+                    os.stat(dir)
+            except:
+                    try:
+                        os.mkdir(dir)
+                    except OSError:
+                        # Created meanwhile by a concurrent run
+                        if not os.path.isdir(dir):
+                            raise
+
+        if trace:
+            f = open(filename + '.workload', 'w')
+            print >>f, json.dumps(workload,sort_keys=True, indent=4)
+            f.close()
 
         if (old):
             # log the converted old_to_new network graph
             workload = old_to_new(workload) 
-            f = open(filename + '.newworkload', 'w')
-            print >>f, json.dumps(workload,sort_keys=True, indent=4)
-            f.close()
+            if trace:
+                f = open(filename + '.newworkload', 'w')
+                print >>f, json.dumps(workload,sort_keys=True, indent=4)
+                f.close()
             metrics = self.run(workload, sync_period, step_size,
                                ignore_remaining, show_graph=show_graph,
                                staleness=staleness)
@@ -403,11 +515,12 @@ class LinkBalancerSim(Simulation):
                                ignore_remaining, show_graph=show_graph,
                                staleness=staleness)
 
-        f = open(filename + '.metrics', 'w')
-        print >>f, json.dumps(metrics, sort_keys=True, indent=4)
-        f.close()
+        if trace:
+            f = open(filename + '.metrics', 'w')
+            print >>f, json.dumps(metrics, sort_keys=True, indent=4)
+            f.close()
 
-        if show_graph:
+        if show_graph and trace:
             # log the network graph if not already drawn
             try:
                 os.stat(filename + ".pdf")
@@ -430,7 +543,7 @@ class LinkBalancerSim(Simulation):
 
         c0 = [v['used'] for (s,d,v) in (self.ctrls[0].graph.edges(data=True))]
         c1 = [v['used'] for (s,d,v) in (self.ctrls[1].graph.edges(data=True))]
-        pn = [v['used'] for (s,d,v) in (self.graph.edges(data=True))]
+        pn = [v['used'] for v in self.store.attrs]
 
         d_c0_c1 = sqrt(sum([(v1-v2)**2 for (v1,v2) in zip(c0,c1)]))
         d_c0_pn = sqrt(sum([(v1-v2)**2 for (v1,v2) in zip(c0,pn)]))
@@ -444,8 +557,8 @@ class LinkBalancerSim(Simulation):
          #("new_reqs", new_reqs),
          ("servers",  map(lambda(x): (x, self.server_utilization(x)), self.servers)),
          ("ingress",  sum_grouped_by(lambda(flow): (flow[1][-1], flow[2]), self.active_flows)),
-         ("pn_view", [(v['used']/v['capacity'], s, d) for (s,d,v) in (self.graph.edges(data=True))]),
-         ("pn_view_raw", [(v['used'], s, d) for (s,d,v) in (self.graph.edges(data=True))])
+         ("pn_view", [(v['used']/v['capacity'], s, d) for ((s,d),v) in zip(self.store.edges, self.store.attrs)]),
+         ("pn_view_raw", [(v['used'], s, d) for ((s,d),v) in zip(self.store.edges, self.store.attrs)])
          ]
         )
         # distributed NIB state
@@ -3,12 +3,16 @@
 # Dan Levin <dlevin@net.t-labs.tu-berlin.de>
 # Brandon Heller <brandonh@stanford.edu>
 
+from collections import namedtuple
+from itertools import cycle, islice, repeat
 import json
 import logging
 from math import floor, pi, sin
+from numbers import Integral
 from random import choice, randint, random
 import random
-import unittest
+
+import numpy as np
 
 def unit_workload(sw, size, duration, numreqs):
     """
@@ -23,10 +27,10 @@ def unit_workload(sw, size, duration, numreqs):
         # Each list element corresponds to one request arrival:
         # (time of arrival, arriving at switch, size, duration)
     """
-    workload = []
-    for t in range(numreqs):
-        requests = (t, sw[t % len(sw)], size, duration)
-        workload.append(requests)
+    # Arrival times count up while the switches repeat round-robin; zip
+    # assembles all request tuples without a Python-level loop
+    workload = zip(range(numreqs), islice(cycle(sw), numreqs),
+                   repeat(size, numreqs), repeat(duration, numreqs))
 
     return workload
 
@@ -106,7 +110,8 @@ def random_int_workload(sw, size, duration, numreqs):
 ############ Refactored to here, @Dan, begin here tomorrow
 
 
-def generic_workload(switch_workload_fcns, size, duration, timesteps):
+def generic_workload(switch_workload_fcns, size, duration, timesteps,
+                     switches=None):
     """
     Return workload description based on input functions for each switch
 
@@ -119,6 +124,8 @@ def generic_workload(switch_workload_fcns, size, duration, timesteps):
     switches_workload_fcns: dict of switch names to workload functions
         A workload function returns the total demand at a given time.
         Its only input is the current timestep.
+        In place of a function, a switch may map to an array of its total
+        demand at each timestep, e.g. from sawtooth_array.
     size: bw of each request (unitless)
         Requests are CBR and bin-packed until no more space remains.
         TODO: Generalize the size/duration fields to support a type of UDP or
@@ -126,24 +133,105 @@ def generic_workload(switch_workload_fcns, size, duration, timesteps):
     duration: length of each request (unitless)
         Requests are CBR.
     timesteps: number of timesteps
+    switches: the keys of switch_workload_fcns, in the order in which their
+        requests are listed within each timestep. Defaults to sorted order;
+        callers generating many workloads for one switch set can sort once
     returns: workload structure
         # Workload is a list of lists.
         # Each top-level list element corresponds to one time step.
         # Each second-level list element is a tuple of:
         #   (switch, size, duration)
     """
-    workload = []
-    switches = sorted(switch_workload_fcns.keys())
+    return list(generic_workload_iter(switch_workload_fcns, size, duration,
+                                      timesteps, switches))
+
+
+def generic_workload_iter(switch_workload_fcns, size, duration, timesteps,
+                          switches=None):
+    """
+    Generate the workload of generic_workload one timestep at a time
+
+    Arguments are those of generic_workload.
+    yields: the list of (switch, size, duration) requests of each timestep,
+        so that only one timestep's requests are in memory at once. Can be
+        passed to old_to_new in place of a generic_workload workload.
+    """
+    if switches is None:
+        switches = sorted(switch_workload_fcns.keys())
+    size_f = float(size)
+    # Per switch, in order: its request tuple, and either its request count
+    # at every timestep (for demand arrays) or its workload function
+    sources = []
+    for sw in switches:
+        demand = switch_workload_fcns[sw]
+        req = (sw, size, duration)
+        if callable(demand):
+            sources.append((req, None, demand))
+        else:
+            demands = np.asarray(demand, dtype=np.float64)
+            # floor of the quotient, as for functions: np.floor_divide
+            # rounds differently, e.g. 0.5 // 0.1 == 4.0
+            counts = np.floor(demands / size_f).astype(np.int64).tolist()
+            sources.append((req, counts, None))
     for t in range(timesteps):
         requests = []
-        for sw in switches:
-            total_demand = switch_workload_fcns[sw](t)
-            # Approximate desired demand based on size
-            num_requests = int(floor(total_demand / float(size)))
-            for req in range(num_requests):
-                requests.append((sw, size, duration))
-        workload.append(requests)
-    return workload
+        for req, counts, fcn in sources:
+            if counts is not None:
+                num_requests = counts[t]
+            else:
+                # Approximate desired demand based on size. Truncation
+                # floors non-negative demands; negative ones yield no
+                # requests either way
+                num_requests = int(fcn(t) / size_f)
+            # Requests are identical, immutable tuples: share one
+            requests += [req] * num_requests
+        yield requests
+
+
+# Structure-of-arrays form of a generic_workload workload. Requests are
+# ordered as in generic_workload; those of timestep t are the slice
+# t_offsets[t]:t_offsets[t + 1] of sw_ids, sizes and durations
+WorkloadSoA = namedtuple('WorkloadSoA', ['switches', 'sw_ids', 'sizes',
+                                         'durations', 't_offsets'])
+
+def generic_workload_soa(switch_workload_fcns, size, duration, timesteps,
+                         switches=None):
+    """
+    Return the workload of generic_workload as a WorkloadSoA of NumPy arrays
+
+    Arguments are those of generic_workload.
+    returns: WorkloadSoA, where
+        switches: list of switch names, sorted unless given
+        sw_ids: int32 array, index into switches of each request's switch
+        sizes, durations: float64 arrays, size and duration of each request
+        t_offsets: int64 array of timesteps + 1 offsets into the request
+            arrays, of the first request of each timestep
+    """
+    if switches is None:
+        switches = sorted(switch_workload_fcns.keys())
+    size_f = float(size)
+    # Request count of each switch (row) at each timestep (column)
+    counts = np.zeros((len(switches), timesteps), dtype=np.int64)
+    for i, sw in enumerate(switches):
+        demand = switch_workload_fcns[sw]
+        if callable(demand):
+            demands = np.array([demand(t) for t in range(timesteps)],
+                               dtype=np.float64)
+        else:
+            demands = np.asarray(demand, dtype=np.float64)[:timesteps]
+        counts[i] = np.floor(demands / size_f)
+    # A negative demand yields no requests, as in generic_workload
+    counts = np.maximum(counts, 0)
+
+    # Timestep-major: all requests of timestep 0, in switch order, then 1...
+    ids = np.tile(np.arange(len(switches), dtype=np.int32), timesteps)
+    sw_ids = np.repeat(ids, counts.T.ravel())
+    t_offsets = np.zeros(timesteps + 1, dtype=np.int64)
+    np.cumsum(counts.sum(axis=0), out=t_offsets[1:])
+    n = len(sw_ids)
+    return WorkloadSoA(switches, sw_ids,
+                       np.full(n, size, dtype=np.float64),
+                       np.full(n, duration, dtype=np.float64), t_offsets)
 
 
 def sawtooth(t, period, offset, max_demand, y_shift=0):
@@ -153,11 +241,37 @@ def sawtooth(t, period, offset, max_demand, y_shift=0):
     y-axis. E.g., With max_demand = 60 and y_shift 1/2 will shift the wave up
     so that it oscillates between 90 and 30 demand units, instead of 60 and 0
     """
-    phase = (t + offset) % float(period)
-    if phase < period / 2.0:
-        return phase / float(period / 2.0) * max_demand + (y_shift * max_demand)
-    else:
-        return (period - phase) / float(period / 2.0) * max_demand + (y_shift * max_demand)
+    phase = (t + offset) % period
+    # Distance from the nearest trough, without branching on the half
+    # period: phase on the rising edge, period - phase on the falling one
+    rising = min(phase, period - phase)
+    return rising / (period * 0.5) * max_demand + (y_shift * max_demand)
+
+
+def make_sawtooth(period, offset, max_demand, y_shift=0):
+    """Return a function of t, equal to sawtooth(t, period, offset, ...)
+
+    Terms that do not depend on t are computed once, for callers which
+    evaluate the same sawtooth at many timesteps
+    """
+    half = period * 0.5
+    shift = y_shift * max_demand
+    def sawtooth_t(t):
+        phase = (t + offset) % period
+        return min(phase, period - phase) / half * max_demand + shift
+    return sawtooth_t
+
+
+def sawtooth_array(ts, period, offset, max_demand, y_shift=0):
+    """Sawtooth over an array of timesteps ts, as NumPy array of demands
+
+    Elementwise equal to sawtooth(t, period, offset, max_demand, y_shift)
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    half = period * 0.5
+    phase = np.mod(ts + offset, period)
+    rising = np.minimum(phase, period - phase)
+    return rising / half * max_demand + (y_shift * max_demand)
 
 
 def wave(t, period, offset, max_demand, y_shift=0):
@@ -172,12 +286,29 @@ def wave(t, period, offset, max_demand, y_shift=0):
     y-axis. E.g., With max_demand = 60 and y_shift 1/2 will shift the wave up
     so that it oscillates between 90 and 30 demand units, instead of 60 and 0
     """
-    phase_unitless = (t + offset - (period / 4.0)) % float(period)
-    phase_radians = phase_unitless / float(period) * (2.0 * pi)
-    raw_val = (sin(phase_radians) + 1.0) / 2.0
+    phase_unitless = (t + offset - (period * 0.25)) % period
+    phase_radians = phase_unitless / period * (2.0 * pi)
+    raw_val = (sin(phase_radians) + 1.0) * 0.5
     return (raw_val * max_demand) + (y_shift * max_demand)
 
 
+def wave_array(ts, period, offset, max_demand, y_shift=0):
+    """Wave over an array of timesteps ts, as NumPy array of demands
+
+    Elementwise equal to wave(t, period, offset, max_demand, y_shift)
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    phase_unitless = np.mod(ts + offset - (period * 0.25), period)
+    phase_radians = phase_unitless / period * (2.0 * pi)
+    raw_val = (np.sin(phase_radians) + 1.0) * 0.5
+    return (raw_val * max_demand) + (y_shift * max_demand)
+
+
+# Workload functions with an equivalent that evaluates a whole array of
+# timesteps at once
+WORKLOAD_ARRAY_FCNS = {sawtooth: sawtooth_array, wave: wave_array}
+
+
 
 def dual_offset_workload(switches, period, offset, max_demand, size,
                         duration, timesteps, workload_fcn, y_shift=0):
@@ -203,11 +334,35 @@ def dual_offset_workload(switches, period, offset, max_demand, size,
         #   (switch, size, duration)
     """
     assert len(switches) == 2
+    # Precompute both switches' demand series, all timesteps at once
+    array_fcn = WORKLOAD_ARRAY_FCNS.get(workload_fcn)
+    # Only sawtooth and wave are known to repeat every period steps
+    periodic = array_fcn is not None
+    if array_fcn is None:
+        # No vectorized form: sample the function at each timestep
+        array_fcn = lambda ts, *args: np.array([workload_fcn(t, *args)
+                                                for t in ts.tolist()])
+
+    def series(o):
+        """Demand series of the waveform at offset o"""
+        # With an integral period and an offset in quarter steps, all phase
+        # arithmetic is exact, so one period of a periodic waveform tiled
+        # over all timesteps is identical to evaluating every timestep
+        if (periodic and isinstance(period, Integral) and
+            0 < period < timesteps and o * 4 == floor(o * 4)):
+            reps = timesteps // period + 1
+            one_period = array_fcn(np.arange(period), period, o, max_demand,
+                                   y_shift)
+            return np.tile(one_period, reps)[:timesteps]
+        return array_fcn(np.arange(timesteps), period, o, max_demand,
+                         y_shift)
+
     switch_workload_fcns = {
-        switches[0]: lambda t: workload_fcn(t, period, 0, max_demand, y_shift),
-        switches[1]: lambda t: workload_fcn(t, period, offset, max_demand, y_shift)
+        switches[0]: series(0),
+        switches[1]: series(offset)
     }
-    return generic_workload(switch_workload_fcns, size, duration, timesteps)
+    return generic_workload(switch_workload_fcns, size, duration, timesteps,
+                            switches=sorted(switches))
 
 def old_to_new(workload, strictly_increasing_time=True):
     """ 
@@ -224,49 +379,3 @@ def old_to_new(workload, strictly_increasing_time=True):
             assert len(req) == 3
             new_workload.append((i+frac, req[0], req[1], req[2]))
     return new_workload
-
-
-def assertListsAlmostEqual(test, one, two):
-    """Check that lists w/floating-point values are about equal.
-
-    test: instance of unittest.TestCase
-    """
-    test.assertEqual(len(one), len(two))
-    for i in range(len(one)):
-        test.assertAlmostEqual(one[i], two[i])
-
-
-class TestSawtoothWorkload(unittest.TestCase):
-    """Unit tests for generating a sawtooth workload"""
-
-    def test_sawtooth(self):
-        """Verify sawtooth function value extremes."""
-        for period in [4, 5, 8, 10]:
-            max_demand = 10
-            reps = 2  # Repetition of full waveforms
-            st_fcn = lambda t: sawtooth(t, period=period, offset=0,
-                                        max_demand=max_demand)
-            st_offset_fcn = lambda t: sawtooth(t, period=period,
-                                               offset=period / 2.0,
-                                               max_demand=max_demand)
-            for i in range(reps):
-                self.assertEquals(st_fcn(i * period), 0)
-                self.assertEquals(st_offset_fcn(i * period), max_demand)
-                self.assertEquals(st_fcn(i * period + period / 2.0), max_demand)
-                self.assertEquals(st_offset_fcn(i * period + period / 2.0), 0)
-
-
-class TestWaveWorkload(unittest.TestCase):
-    """Unit tests for generating a wave (shifted sine) workload"""
-
-    def test_wave(self):
-        """Verify wave value extremes."""
-        period = 4
-        max_demand = 2
-        st_fcn = lambda t: wave(t, period=period, offset=0,
-                                max_demand=max_demand)
-        test_wave = [st_fcn(i) for i in range(period + 1)]
-        assertListsAlmostEqual(self, test_wave, [0, 1, 2, 1, 0])
-
-if __name__ == '__main__':
-    unittest.main()
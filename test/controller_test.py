@@ -18,23 +18,6 @@ from sim.controller import *
 from sim.simulation import *
 
 
-def graphs_to_lists(graphs=[], attrs=['used', 'capacity']):
-    """
-    Convert N graphs into one list of N lists of graph edge attribute values
-    """
-    lists = [] 
-    
-    for graph in graphs:
-        edgeattrs = []
-        for attr in attrs:
-            for edge in graph.edges(data=True):
-                s, d = edge[:2]
-                edgeattrs.append(graph[s][d][attr])
-        lists.append(edgeattrs)
-
-    return lists
-
-
 class TestController(unittest.TestCase):
     """Unittests for the LinkBalancerCtrl Class"""
 
@@ -65,11 +48,8 @@ class TestController(unittest.TestCase):
         sim = LinkBalancerSim(one_switch_topo(), ctrls)
         sim.run(workload)
 
-        links = ctrls[0].graph.edges(data=True)
-        ctrlview = [(u, v, d['used']) for u, v, d in links]
-
-        links = sim.graph.edges(data=True)
-        simview = [(u, v, d['used']) for u, v, d in links]
+        ctrlview = edge_snapshot(ctrls[0].graph, attrs=('used',))
+        simview = edge_snapshot(sim.graph, attrs=('used',))
 
         self.assertEqual(ctrlview, simview)
 
@@ -84,7 +64,7 @@ class TestController(unittest.TestCase):
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         a, b = ctrls
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, listb)
 
         # This link belongs only to controller a
@@ -92,14 +72,14 @@ class TestController(unittest.TestCase):
         # This link belongs only to controller b
         b.graph['s2']['sw2']['used'] = 80.0
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertNotEqual(lista, listb)
         self.assertNotEqual(a.graph.edges(data=True), b.graph.edges(data=True))
 
         a.sync_toward(b)
         b.sync_toward(a)
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, listb)
 
     def test_two_ctrl_unit_sync_idempotence(self):
@@ -112,30 +92,30 @@ class TestController(unittest.TestCase):
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         a, b = ctrls
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, listb)
 
         #This link is owned by ctrl a
         a.graph['s1']['sw1']['used'] = 10.0
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertNotEqual(lista, listb)
 
         # Should NOT change the state of a or b
         b.sync_toward(a)
-        lista1, listb1 = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista1, listb1 = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, lista1)
         self.assertEqual(listb, listb1)
 
         # Should NOT change the state of a or b
         b.sync_toward(a)
-        lista1, listb1 = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista1, listb1 = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, lista1)
         self.assertEqual(listb, listb1)
 
         # Should change 'used' attribute of b to the state of a
         a.sync_toward(b)
-        lista2, listb2 = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista2, listb2 = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertNotEqual(listb, listb2)
         self.assertEqual(lista2, listb2)
         self.assertEqual(lista2, listb2)
@@ -143,7 +123,7 @@ class TestController(unittest.TestCase):
         # Should NOT change the state of b
         a.sync_toward(b)
 
-        lista3, listb3 = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista3, listb3 = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista3, listb3)
         self.assertEqual(lista2, lista3)
         self.assertEqual(listb2, listb3)
@@ -161,7 +141,7 @@ class TestController(unittest.TestCase):
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         a, b = ctrls
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, listb)
 
         # the link s2->sw2 is within the domain of b
@@ -171,7 +151,7 @@ class TestController(unittest.TestCase):
         # Neither a nor b should change their values for their respective links
         # during the sync
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertNotEqual(lista, listb)
 
         a.sync_toward(b)
@@ -179,7 +159,7 @@ class TestController(unittest.TestCase):
 
         # We can assert over every sim link since there are no other ctrls
         # in sim other than a and b
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, listb)
 
 
@@ -198,7 +178,7 @@ class TestController(unittest.TestCase):
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         a, b = ctrls
 
-        lista, listb = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista, listb = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista, listb)
 
         # This link belongs to both a and b
@@ -206,14 +186,14 @@ class TestController(unittest.TestCase):
         # This link belongs to both a and b
         b.graph['sw2']['sw1']['used'] = 80.0
 
-        lista1, listb1 = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista1, listb1 = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertNotEqual(lista1, listb1)
         self.assertNotEqual(a.graph.edges(data=True), b.graph.edges(data=True))
 
         a.sync_toward(b)
         b.sync_toward(a)
 
-        lista2, listb2 = graphs_to_lists([a.graph, b.graph], ['used', 'capacity'])
+        lista2, listb2 = edge_snapshot(a.graph), edge_snapshot(b.graph)
         self.assertEqual(lista1, lista2)
         self.assertEqual(listb1, listb2)
 
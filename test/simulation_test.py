@@ -3,12 +3,15 @@
 # Dan Levin <dlevin@net.t-labs.tu-berlin.de>
 # Brandon Heller <brandonh@stanford.edu>
 
+from __future__ import division
 
+from multiprocessing import Pool
 import os
 import sys
 import unittest
 
 import networkx as nx
+import numpy as np
 
 from test_helper import *
 
@@ -24,16 +27,21 @@ from sim.simulation import *
 
 class SimulationTest(unittest.TestCase):
     """Unit tests for LinkBalancerSim class"""
-    graph = two_switch_topo()
+
+    def setUp(self):
+        # Tests mutate link utilization, so each gets its own edge state
+        self.graph = two_switch_topo()
 
     def test_zero_metric(self):
         """Assert that RMSE metric == 0 for varying link utils"""
         graph = self.graph
         ctrls = [LinkBalancerCtrl(['sw1'], ['s1', 's2'])]
         sim = LinkBalancerSim(graph, ctrls)
+        edge_attrs = [(d, d['capacity']) for u, v, d in graph.edges(data=True)]
         for util in [0.0, 0.5, 1.0]:
-            for u, v in graph.edges():
-                graph[u][v]['used'] = util * graph[u][v]['capacity']
+            for d, cap in edge_attrs:
+                d['used'] = util * cap
+            sim.touch()
             self.assertEqual(sim.rmse_links(graph), 0.0)
 
     def test_metric_unbalanced(self):
@@ -41,11 +49,16 @@ class SimulationTest(unittest.TestCase):
         graph = self.graph
         ctrls = [LinkBalancerCtrl(['sw1'], ['s1', 's2'])]
         sim = LinkBalancerSim(graph, ctrls)
-        increasingvalue = 0
-        for u, v in graph.edges():
-            graph[u][v]["used"] = increasingvalue
-            increasingvalue += 1
+        self.assertEqual(sim.rmse_links(graph), 0)
+        edge_attrs = [d for u, v, d in graph.edges(data=True)]
+        for increasingvalue, d in enumerate(edge_attrs):
+            d["used"] = increasingvalue
+        # Direct edge writes must invalidate the cached metric
+        sim.touch()
         self.assertNotEqual(sim.rmse_links(graph), 0)
+        used, capacity = edge_arrays(graph)
+        self.assertAlmostEqual(sim.rmse_links(graph),
+                               rmse_from_arrays(used, capacity))
 
     def test_metric_unbalanced_known(self):
         """Assert that the unweighted metric == 50.0 for this given case"""
@@ -66,7 +79,8 @@ class SimulationTest(unittest.TestCase):
         ctrls = [LinkBalancerCtrl(['sw1'], ['s1', 's2'])]
         sim = LinkBalancerSim(graph, ctrls)
         metric_before_alloc = sim.rmse_links(graph)
-        path = nx.shortest_path(graph, 's1', 'sw1')
+        # s1 hangs directly off sw1: its only path is that single link
+        path = ['s1', 'sw1']
 
         sim.allocate_resources(path, 40, 5, 1)
         metric_after_alloc = sim.rmse_links(graph)
@@ -83,36 +97,90 @@ class SimulationTest(unittest.TestCase):
         SERVERS = ['s1', 's2']
         graph = self.graph
         max_duration = 10
-        durations = range(1, max_duration)
         steps = 100
-        a = nx.shortest_path(graph, choice(SERVERS), choice(SWITCHES))
-        b = nx.shortest_path(graph, choice(SERVERS), choice(SWITCHES))
-        paths = [a, b]
-        workload = [(choice(paths), choice(durations)) for t in range(steps)]
+        # Seeded, so that a failing draw can be replayed
+        rng = np.random.RandomState(12345)
+        a = nx.shortest_path(graph, SERVERS[rng.randint(len(SERVERS))],
+                             SWITCHES[rng.randint(len(SWITCHES))])
+        b = nx.shortest_path(graph, SERVERS[rng.randint(len(SERVERS))],
+                             SWITCHES[rng.randint(len(SWITCHES))])
+        paths = (a, b)
+        # Draw all path and duration picks in one go
+        path_picks = rng.randint(0, len(paths), size=steps)
+        dur_picks = rng.randint(1, max_duration, size=steps)
 
         ctrls = [LinkBalancerCtrl(['sw1', 'sw2'])]
         sim = LinkBalancerSim(graph, ctrls)
 
         metric_before_alloc = sim.rmse_links(graph)
 
-        for now, item in enumerate(workload):
-            path, dur = item
+        for now in range(steps):
             sim.free_resources(now)
-            sim.allocate_resources(path, 1, now, dur)
+            sim.allocate_resources(paths[path_picks[now]], 1, now,
+                                   int(dur_picks[now]))
 
         # Free the (up to max_duration) possibly remaining live flows
-        for i in range(len(workload), steps + max_duration):
-            sim.free_resources(i)
+        sim.drain()
 
         metric_after_free = sim.rmse_links(graph)
 
         self.assertEqual(metric_before_alloc, metric_after_free)
         self.assertEqual(len(sim.active_flows), 0)
 
+    def test_free_fractional_expiry(self):
+        """Assert that flows are freed once their (fractional) expiry passes"""
+        graph = self.graph
+        ctrls = [LinkBalancerCtrl(['sw1'], ['s1', 's2'])]
+        sim = LinkBalancerSim(graph, ctrls)
+        path = ['s1', 'sw1']
+        sim.allocate_resources(path, 10, 0.5, 1)
+        sim.allocate_resources(path, 10, 0.5, 1)
+        sim.allocate_resources(path, 10, 1, 1)
+        self.assertEqual(len(sim.active_flows), 3)
+        sim.free_resources(1.5)
+        self.assertEqual(len(sim.active_flows), 1)
+        self.assertEqual(graph['s1']['sw1']['used'], 10)
+        sim.free_resources(2)
+        self.assertEqual(len(sim.active_flows), 0)
+        self.assertEqual(graph['s1']['sw1']['used'], 0)
+
+    def test_run_without_trace(self):
+        """Assert that trace=False returns the metrics but writes no files"""
+        name = self._testMethodName
+        workload = unit_workload(sw=['sw1', 'sw2'], size=1, duration=2,
+                                 numreqs=10)
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        expected = sim.run(list(workload))
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        metrics = sim.run_and_trace(name, workload, trace=False)
+        self.assertEqual(metrics['rmse_servers'], expected['rmse_servers'])
+        self.assertFalse(os.path.exists('logs/' + name + '.metrics'))
+
 ###############################################################################
 
+def _vary_phase_rmse_sum(args):
+    """Run one test_two_ctrl_vary_phase simulation, return its summed server
+    RMSE. Lives at module level so that multiprocessing can pickle it."""
+    name, workload_fcn, period, offset, max_demand, timesteps = args
+    workload = dual_offset_workload(switches=['sw1', 'sw2'],
+                                    period=period,
+                                    offset=offset,
+                                    max_demand=max_demand,
+                                    size=1, duration=1,
+                                    timesteps=timesteps,
+                                    workload_fcn=workload_fcn)
+    ctrls = strictly_local_ctrls()
+    sim = LinkBalancerSim(two_switch_topo(), ctrls)
+    metrics = sim.run_and_trace(name, workload, old=True,
+                                sync_period=timesteps,
+                                ignore_remaining=True, trace=False)
+    return sum(metrics['rmse_servers'])
+
+
 class TestTwoSwitch(unittest.TestCase):
     """Unit tests for two-switch simulation scenario"""
+    # Keep the default failure text when a test adds its own message
+    longMessage = True
 
     def test_one_switch_oversubscribe(self):
         """Test that an oversubscribed network drops requests"""
@@ -132,7 +200,7 @@ class TestTwoSwitch(unittest.TestCase):
         workload = unit_workload(sw=['sw1'], size=1,
                                  duration=2, numreqs=10)
 
-        myname = sys._getframe().f_code.co_name
+        myname = self._testMethodName
 
         ctrls = [LinkBalancerCtrl(sw=['sw1'], srv=['s1', 's2'])]
         sim = LinkBalancerSim(one_switch_topo(), ctrls)
@@ -147,7 +215,9 @@ class TestTwoSwitch(unittest.TestCase):
                                      0.0, 0.0, 0.0, 0.0, 0.7071067811865476, 0.0],
                     'rmse_links': [0.7071067811865476, 0.0, 0.0, 0.0, 0.0, 0.0,
                                    0.0, 0.0, 0.0, 0.0, 0.7071067811865476, 0.0]}
-        self.assertEqual(metrics, expected)
+        self.assertEqual(sorted(metrics), sorted(expected))
+        for k in ('rmse_links', 'rmse_servers'):
+            np.testing.assert_allclose(metrics[k], expected[k], atol=1e-12)
 
     def test_two_ctrl_simple(self):
         """For 2 perfectly synced controllers, server RMSE approaches 0."""
@@ -156,7 +226,7 @@ class TestTwoSwitch(unittest.TestCase):
 
         ctrls = two_ctrls()
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
-        myname = sys._getframe().f_code.co_name
+        myname = self._testMethodName
         metrics = sim.run_and_trace(myname, workload, ignore_remaining=True)
         # see test_one_ctrl_multi_step for why we slice
         for metric_val in metrics['rmse_servers'][1:]:
@@ -170,16 +240,16 @@ class TestTwoSwitch(unittest.TestCase):
         workload = dual_offset_workload(switches=['sw1', 'sw2'],
                                         period=period, offset=0,
                                         max_demand=max_demand, size=1,
-                                        duration=1, timesteps=timesteps,
+                                        duration=1,
+                                        timesteps=timesteps,
                                         workload_fcn=sawtooth)
 
         ctrls = two_ctrls()
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
-        myname = sys._getframe().f_code.co_name
+        myname = self._testMethodName
         metrics = sim.run_and_trace(myname, workload, old=True,
                                     sync_period=timesteps)
-        for metric_val in metrics['rmse_servers']:
-            self.assertAlmostEqual(metric_val, 0.0)
+        np.testing.assert_allclose(metrics['rmse_servers'], 0.0, atol=1e-7)
 
     def test_two_ctrl_sawtooth_outofphase(self, period=2):
         """For out-of-phase sawtooth with 2 ctrls, verify server RMSE.
@@ -189,28 +259,36 @@ class TestTwoSwitch(unittest.TestCase):
         #for period in [2, 4, 5, 10]:
         timesteps = period * 2
         dur = 1
+        myname = self._testMethodName + str(period)
+        # Timesteps aligned with a sawtooth crossing
+        crossing = np.arange(timesteps) % (period / 2.0) == period / 4.0
+        # One graph serves every max_demand: its links are reset per run
+        graph = two_switch_topo()
+        edge_attrs = [d for u, v, d in graph.edges(data=True)]
         for max_demand in [2,4,6,8,10]:
             workload = dual_offset_workload(switches=['sw1', 'sw2'],
-                                            period=period, offset=period / 2.0,
-                                            max_demand=max_demand, size=1,
-                                            duration=dur, timesteps=timesteps,
+                                            period=period,
+                                            offset=period / 2.0,
+                                            max_demand=max_demand,
+                                            size=1, duration=dur,
+                                            timesteps=timesteps,
                                             workload_fcn=sawtooth)
 
+            for d in edge_attrs:
+                d['used'] = 0.0
             ctrls = strictly_local_ctrls(2)
 
-            sim = LinkBalancerSim(two_switch_topo(), ctrls)
-            myname = sys._getframe().f_code.co_name + str(period)
+            sim = LinkBalancerSim(graph, ctrls)
             metrics = sim.run_and_trace(myname, workload, old=True,
                                         sync_period=timesteps,
                                         ignore_remaining=True)
-            self.assertEqual(len(metrics['rmse_servers']), timesteps)
-            for i, metric_val in enumerate(metrics['rmse_servers']):
-                print "step: %d, metric_val=%d, period=%d" %(i, metric_val, period)
-                # When aligned with a sawtooth crossing, RMSE should be equal.
-                if i % (period / 2.0) == period / 4.0:
-                    self.assertAlmostEqual(metric_val, 0.0)
-                else:
-                    self.assertTrue(metric_val > 0.0)
+            msg = 'max_demand=%d' % max_demand
+            self.assertEqual(len(metrics['rmse_servers']), timesteps, msg)
+            rmse = np.array(metrics['rmse_servers'])
+            # When aligned with a sawtooth crossing, RMSE should be equal.
+            np.testing.assert_allclose(rmse[crossing], 0.0, atol=1e-7,
+                                       err_msg=msg)
+            self.assertTrue(np.all(rmse[~crossing] > 0.0), msg)
 
     def test_two_ctrl_wave_inphase(self, max_demand=2):
         """For in-phase wave with 2 ctrls, ensure server RMSE == 0."""
@@ -223,16 +301,16 @@ class TestTwoSwitch(unittest.TestCase):
         workload = dual_offset_workload(switches=['sw1', 'sw2'],
                                         period=period, offset=0,
                                         max_demand=max_demand, size=1,
-                                        duration=1, timesteps=timesteps,
+                                        duration=1,
+                                        timesteps=timesteps,
                                         workload_fcn=wave)
 
         ctrls = two_ctrls()
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
-        myname = sys._getframe().f_code.co_name
+        myname = self._testMethodName
         metrics = sim.run_and_trace(myname, workload, old=True,
                                     sync_period=timesteps)
-        for metric_val in metrics['rmse_servers']:
-            self.assertAlmostEqual(metric_val, 0.0)
+        np.testing.assert_allclose(metrics['rmse_servers'], 0.0, atol=1e-7)
 
     def test_two_ctrl_wave_outofphase(self, period=4):
         """For out-of-phase wave with 2 ctrls, verify server RMSE.
@@ -245,25 +323,26 @@ class TestTwoSwitch(unittest.TestCase):
         dur = 1
         timesteps = period * 2
         workload = dual_offset_workload(switches=['sw1', 'sw2'],
-                                        period=period, offset=period / 2.0,
+                                        period=period,
+                                        offset=period / 2.0,
                                         max_demand=max_demand, size=1,
-                                        duration=dur, timesteps=timesteps,
+                                        duration=dur,
+                                        timesteps=timesteps,
                                         workload_fcn=wave)
 
         ctrls = strictly_local_ctrls(2)
 
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
-        myname = sys._getframe().f_code.co_name + str(period)
+        myname = self._testMethodName + str(period)
         metrics = sim.run_and_trace(myname, workload, old=True,
                                     sync_period=timesteps,
                                     ignore_remaining=True)
         self.assertEqual(len(metrics['rmse_servers']), timesteps)
-        for i, metric_val in enumerate(metrics['rmse_servers']):
-            # When aligned with a wave crossing, RMSE should be equal.
-            if i % (period / 2.0) == period / 4.0:
-                self.assertAlmostEqual(metric_val, 0.0)
-            else:
-                self.assertTrue(metric_val > 0.0)
+        rmse = np.array(metrics['rmse_servers'])
+        # When aligned with a wave crossing, RMSE should be equal.
+        crossing = np.arange(timesteps) % (period / 2.0) == period / 4.0
+        np.testing.assert_allclose(rmse[crossing], 0.0, atol=1e-7)
+        self.assertTrue(np.all(rmse[~crossing] > 0.0))
 
     def test_two_ctrl_vary_phase(self, period=10):
         """simulation_test#test_two_ctrl_vary_phase: Ensure server RMSE is maximized when demands are out-of-phase
@@ -276,35 +355,34 @@ class TestTwoSwitch(unittest.TestCase):
         timesteps = period * 2
         max_demand = 10
 #       for max_demand in [2,5,10,20]:
-        for workload_fcn in [sawtooth, wave]:
-            rmse_sums = []
-            for step in range(offset_steps + 1):
-                offset = step / float(offset_steps) * period
-                workload = dual_offset_workload(switches=['sw1', 'sw2'],
-                                                period=period,
-                                                offset=offset,
-                                                max_demand=max_demand,
-                                                size=1, duration=1,
-                                                timesteps=timesteps,
-                                                workload_fcn=workload_fcn)
-                ctrls = strictly_local_ctrls()
-                sim = LinkBalancerSim(two_switch_topo(), ctrls)
-                myname = sys._getframe().f_code.co_name
-                metrics = sim.run_and_trace(myname, workload, old=True,
-                                            sync_period=timesteps,
-                                            ignore_remaining=True)
-                rmse_sum = sum(metrics['rmse_servers'])
-                rmse_sums.append(rmse_sum)
-
-
-            # Ensure that RMSE sums start at 0, rise to max at period/2,
-            # then go back to 0 at the end.
-            for i in range(1, offset_steps / 2):
-                self.assertTrue(rmse_sums[i] >= rmse_sums[i - 1])
-            for i in range(offset_steps / 2 + 1, offset_steps + 1):
-                self.assertTrue(rmse_sums[i] <= rmse_sums[i - 1])
-            self.assertAlmostEqual(0.0, rmse_sums[0])
-            self.assertAlmostEqual(0.0, rmse_sums[-1])
+        myname = self._testMethodName
+        # Each offset is an independent simulation: run them across cores
+        # unless SERIAL is set in the environment
+        if os.environ.get('SERIAL'):
+            pool = None
+            run_all = map
+        else:
+            pool = Pool()
+            run_all = pool.map
+        try:
+            for workload_fcn in [sawtooth, wave]:
+                runs = [(myname, workload_fcn, period,
+                         step / offset_steps * period, max_demand, timesteps)
+                        for step in range(offset_steps + 1)]
+                rmse_sums = run_all(_vary_phase_rmse_sum, runs)
+
+                # Ensure that RMSE sums start at 0, rise to max at period/2,
+                # then go back to 0 at the end.
+                sums = np.asarray(rmse_sums)
+                half = offset_steps // 2
+                self.assertTrue(np.all(np.diff(sums[:half]) >= 0))
+                self.assertTrue(np.all(np.diff(sums[half:]) <= 0))
+                self.assertAlmostEqual(0.0, rmse_sums[0])
+                self.assertAlmostEqual(0.0, rmse_sums[-1])
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
 
 
 if __name__ == '__main__':
@@ -4,8 +4,8 @@
 # Brandon Heller <brandonh@stanford.edu>
 
 import networkx as nx
+import numpy as np
 import os
-import unittest
 import sys
 import unittest
 
@@ -17,49 +17,62 @@ from sim.controller import *
 # Test helper functions
 ###############################################################################
 
-def one_switch_topo():
+def _fast_digraph(nodes_by_type, edges):
+    """
+    Return a DiGraph of a small, fixed topology, built by writing the
+    adjacency dicts of NetworkX 1.x directly instead of going through
+    add_nodes_from/add_edges_from
+    nodes_by_type: dict of node type to list of node names
+    edges: list of [u, v, attrs] edges. Each attrs dict becomes the edge's
+    attribute dict as is, so it must not be shared between edges
+    """
     graph = nx.DiGraph()
-    graph.add_nodes_from(['sw1'], type='switch')
-    graph.add_nodes_from(['s1', 's2'], type='server')
-    graph.add_edges_from([['s1', 'sw1', {'capacity':100, 'used':0.0}],
-                          ['s2', 'sw1', {'capacity':100, 'used':0.0}]])
+    for node_type, names in nodes_by_type.items():
+        for name in names:
+            graph.node[name] = {'type': node_type}
+            graph.succ[name] = {}
+            graph.pred[name] = {}
+    for u, v, attrs in edges:
+        graph.succ[u][v] = attrs
+        graph.pred[v][u] = attrs
     return graph
 
+def one_switch_topo():
+    return _fast_digraph({'switch': ['sw1'],
+                          'server': ['s1', 's2']},
+                         [['s1', 'sw1', {'capacity':100, 'used':0.0}],
+                          ['s2', 'sw1', {'capacity':100, 'used':0.0}]])
+
 def two_switch_topo():
-    graph = nx.DiGraph()
-    graph.add_nodes_from(['sw1', 'sw2'], type='switch')
-    graph.add_nodes_from(['s1', 's2'], type='server')
-    graph.add_edges_from([['s1', 'sw1', {'capacity':100, 'used':0.0}],
+    return _fast_digraph({'switch': ['sw1', 'sw2'],
+                          'server': ['s1', 's2']},
+                         [['s1', 'sw1', {'capacity':100, 'used':0.0}],
                           ['sw1', 'sw2', {'capacity':1001, 'used':0.0}],
                           ['sw2', 'sw1', {'capacity':1001, 'used':0.0}],
                           ['s2', 'sw2', {'capacity':100, 'used':0.0}]])
-    return graph
 
     
 
 # Anja's topology suggestion to test for non-triviality of 'SW2'
 # decision on whom to send requests when not served by s2
 def three_switch_triangle_topo():
-    graph = nx.DiGraph()
-    graph.add_nodes_from(['sw1', 'sw2', 'sw3'], type='switch')
-    graph.add_nodes_from(['s1', 's2', 's3'], type='server')
-    graph.add_edges_from([['s1', 'sw1', {'capacity':100, 'used':0.0}],
+    return _fast_digraph({'switch': ['sw1', 'sw2', 'sw3'],
+                          'server': ['s1', 's2', 's3']},
+                         [['s1', 'sw1', {'capacity':100, 'used':0.0}],
                           ['sw1', 'sw2', {'capacity':50, 'used':0.0}],
                           ['sw2', 'sw1', {'capacity':50, 'used':0.0}],
                           ['sw2', 'sw3', {'capacity':50, 'used':0.0}],
                           ['sw3', 'sw2', {'capacity':50, 'used':0.0}],
                           ['s2', 'sw2', {'capacity':100, 'used':0.0}],
                           ['s3', 'sw3', {'capacity':100, 'used':0.0}]])
-    return graph
 
 
 # Dan put this here to generate a topology figure to demonstrate corner cases
 # of simulation logic
 def cornercase_topo():
-    graph = nx.DiGraph()
-    graph.add_nodes_from(['sw1', 'sw2', 'sw3', 'sw4'], type='switch')
-    graph.add_nodes_from(['s1a', 's1b', 's3', 's4'], type='server')
-    graph.add_edges_from([['s1a', 'sw1', {'capacity':100, 'used':0.0}],
+    return _fast_digraph({'switch': ['sw1', 'sw2', 'sw3', 'sw4'],
+                          'server': ['s1a', 's1b', 's3', 's4']},
+                         [['s1a', 'sw1', {'capacity':100, 'used':0.0}],
                           ['s1b', 'sw1', {'capacity':100, 'used':0.0}],
                           ['sw1', 'sw2', {'capacity':50, 'used':0.0}],
                           ['sw2', 'sw1', {'capacity':50, 'used':0.0}],
@@ -69,7 +82,24 @@ def cornercase_topo():
                           ['sw4', 'sw3', {'capacity':50, 'used':0.0}],
                           ['s3', 'sw3', {'capacity':100, 'used':0.0}],
                           ['s4', 'sw4', {'capacity':100, 'used':0.0}]])
-    return graph
+
+def edge_snapshot(graph, attrs=('used', 'capacity')):
+    """Return dict of each edge (u, v) to the tuple of its attrs values, for
+    comparing the link state of graphs in a single assertion"""
+    return dict(((u, v), tuple(d[attr] for attr in attrs))
+                for u, v, d in graph.edges(data=True))
+
+def edge_arrays(graph):
+    """Return (used, capacity) NumPy arrays, in graph.edges() order"""
+    attrs = [a for u, v, a in graph.edges(data=True)]
+    used = np.array([a['used'] for a in attrs], dtype=np.float64)
+    capacity = np.array([a['capacity'] for a in attrs], dtype=np.float64)
+    return used, capacity
+
+def rmse_from_arrays(used, capacity):
+    """Reference implementation of LinkBalancerSim.rmse_links over arrays"""
+    opt_used = (used.sum() / capacity.sum()) * capacity
+    return np.sqrt(((used - opt_used) ** 2).sum())
 
 #TODO Dan: I plan to refactor the controllers into the *topo() functions to
 # return a (graph, controller[]) tuple
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.workload import *
+
+
+def assertListsAlmostEqual(test, one, two):
+    """Check that lists w/floating-point values are about equal.
+
+    test: instance of unittest.TestCase
+    """
+    test.assertEqual(len(one), len(two))
+    for i in range(len(one)):
+        test.assertAlmostEqual(one[i], two[i])
+
+
+class TestSawtoothWorkload(unittest.TestCase):
+    """Unit tests for generating a sawtooth workload"""
+
+    def test_sawtooth(self):
+        """Verify sawtooth function value extremes."""
+        for period in [4, 5, 8, 10]:
+            max_demand = 10
+            reps = 2  # Repetition of full waveforms
+            st_fcn = lambda t: sawtooth(t, period=period, offset=0,
+                                        max_demand=max_demand)
+            st_offset_fcn = lambda t: sawtooth(t, period=period,
+                                               offset=period / 2.0,
+                                               max_demand=max_demand)
+            for i in range(reps):
+                self.assertEquals(st_fcn(i * period), 0)
+                self.assertEquals(st_offset_fcn(i * period), max_demand)
+                self.assertEquals(st_fcn(i * period + period / 2.0), max_demand)
+                self.assertEquals(st_offset_fcn(i * period + period / 2.0), 0)
+
+    def test_make_sawtooth(self):
+        """Verify make_sawtooth matches sawtooth at every timestep."""
+        for period in [4, 5, 8, 10]:
+            for offset in [0, 1, period / 2.0]:
+                st_fcn = make_sawtooth(period, offset, 10, 0.5)
+                for t in range(2 * period + 1):
+                    self.assertEqual(st_fcn(t),
+                                     sawtooth(t, period, offset, 10, 0.5))
+
+    def test_compute_demands(self):
+        """Verify the per-switch demand kernel matches sawtooth_array."""
+        from sim.jit import compute_demands
+        ts = np.arange(40, dtype=np.float64)
+        params = np.array([[4, 0, 10], [5, 2.5, 8], [8, 1, 3], [10, 5, 9]],
+                          dtype=np.float64)
+        demands = compute_demands(params, ts)
+        for row, (period, offset, max_demand) in zip(demands, params):
+            self.assertEqual(row.tolist(), sawtooth_array(
+                ts, period, offset, max_demand).tolist())
+
+    def test_sawtooth_array(self):
+        """Verify sawtooth_array matches sawtooth at every timestep."""
+        ts = np.arange(40)
+        for period in [4, 5, 8, 10]:
+            for offset in [0, 1, period / 2.0]:
+                expected = [sawtooth(t, period, offset, 10, 0.5) for t in ts]
+                self.assertEqual(sawtooth_array(ts, period, offset, 10,
+                                                0.5).tolist(), expected)
+
+    def test_generic_workload_demand_array(self):
+        """Verify demand arrays yield the same workload as functions."""
+        ts = np.arange(16)
+        fcn = lambda t: sawtooth(t, 8, 2, 9)
+        expected = generic_workload({'sw1': fcn}, size=2, duration=1,
+                                    timesteps=len(ts))
+        workload = generic_workload({'sw1': sawtooth_array(ts, 8, 2, 9)},
+                                    size=2, duration=1, timesteps=len(ts))
+        self.assertEqual(workload, expected)
+
+    def test_generic_workload_fractional_size(self):
+        """Verify demand arrays and functions agree for a size of 0.1."""
+        ts = np.arange(8)
+        fcn = lambda t: sawtooth(t, 4, 0, 1.0)
+        expected = generic_workload({'sw1': fcn}, size=0.1, duration=1,
+                                    timesteps=len(ts))
+        workload = generic_workload({'sw1': sawtooth_array(ts, 4, 0, 1.0)},
+                                    size=0.1, duration=1, timesteps=len(ts))
+        self.assertEqual(workload, expected)
+        self.assertEqual([len(reqs) for reqs in workload[:4]], [0, 5, 10, 5])
+
+
+class TestWaveWorkload(unittest.TestCase):
+    """Unit tests for generating a wave (shifted sine) workload"""
+
+    def test_wave(self):
+        """Verify wave value extremes."""
+        period = 4
+        max_demand = 2
+        st_fcn = lambda t: wave(t, period=period, offset=0,
+                                max_demand=max_demand)
+        test_wave = [st_fcn(i) for i in range(period + 1)]
+        assertListsAlmostEqual(self, test_wave, [0, 1, 2, 1, 0])
+
+    def test_wave_jit(self):
+        """Verify the compiled wave and sawtooth match the Python ones."""
+        from sim.jit import sawtooth_jit, wave_jit
+        for period in [4, 5, 8, 10]:
+            for offset in [0, 1, period / 2.0]:
+                for t in range(2 * period + 1):
+                    self.assertEqual(wave_jit(t, period, offset, 8, 0.5),
+                                     wave(t, period, offset, 8, 0.5))
+                    self.assertEqual(sawtooth_jit(t, period, offset, 8, 0.5),
+                                     sawtooth(t, period, offset, 8, 0.5))
+
+    def test_jit_float_arguments(self):
+        """Verify the compiled kernels accept all-float arguments."""
+        from sim.jit import HAVE_NUMBA, sawtooth_jit, wave_jit
+        if not HAVE_NUMBA:
+            raise unittest.SkipTest('numba is not installed')
+        self.assertEqual(sawtooth_jit(3.0, 8.0, 1.0, 8.0, 0.5),
+                         sawtooth(3.0, 8.0, 1.0, 8.0, 0.5))
+        self.assertEqual(wave_jit(3.0, 8.0, 1.0, 8.0, 0.5),
+                         wave(3.0, 8.0, 1.0, 8.0, 0.5))
+        # njit dispatchers compile in nopython mode or raise, never falling
+        # back to object mode
+        self.assertTrue(sawtooth_jit.nopython_signatures)
+        self.assertTrue(wave_jit.nopython_signatures)
+
+    def test_wave_array(self):
+        """Verify wave_array matches wave at every timestep."""
+        ts = np.arange(40)
+        for period in [4, 5, 8, 10]:
+            for offset in [0, 1, period / 2.0]:
+                expected = [wave(t, period, offset, 8, 0.5) for t in ts]
+                self.assertEqual(wave_array(ts, period, offset, 8,
+                                            0.5).tolist(), expected)
+
+class TestDualOffsetWorkload(unittest.TestCase):
+    """Unit tests for generating a dual offset workload"""
+
+    def test_tiled_period(self):
+        """Verify tiling one period equals sampling every timestep."""
+        for fcn in [sawtooth, wave]:
+            for period in [2, 4, 5, 8, 10]:
+                for offset in [0, 1, period / 2.0, period / 4.0, period / 3.0]:
+                    args = (['sw1', 'sw2'], period, offset, 10, 1, 1,
+                            period * 7 + 3)
+                    sampled = lambda t, *a: fcn(t, *a)
+                    self.assertEqual(dual_offset_workload(*args + (fcn,)),
+                                     dual_offset_workload(*args + (sampled,)))
+
+class TestGenericWorkloadIter(unittest.TestCase):
+    """Unit tests for generating a workload one timestep at a time"""
+
+    def test_matches_generic_workload(self):
+        """Verify the generated timesteps are those of generic_workload."""
+        fcns = {'sw1': lambda t: sawtooth(t, 6, 0, 5),
+                'sw2': wave_array(np.arange(12), 6, 3, 7)}
+        workload = generic_workload(fcns, size=1, duration=2, timesteps=12)
+        gen = generic_workload_iter(fcns, size=1, duration=2, timesteps=12)
+        self.assertEqual(next(gen), workload[0])
+        self.assertEqual(old_to_new(gen), old_to_new(workload[1:]))
+
+    def test_switch_order(self):
+        """Verify requests within a timestep follow the given switch order."""
+        fcns = {'sw1': lambda t: 2, 'sw2': lambda t: 1}
+        gen = generic_workload_iter(fcns, size=1, duration=2, timesteps=1,
+                                    switches=['sw2', 'sw1'])
+        self.assertEqual(next(gen), [('sw2', 1, 2), ('sw1', 1, 2),
+                                     ('sw1', 1, 2)])
+
+class TestWorkloadSoA(unittest.TestCase):
+    """Unit tests for the structure-of-arrays workload representation"""
+
+    def test_matches_generic_workload(self):
+        """Verify each timestep's slice holds generic_workload's requests."""
+        ts = np.arange(12)
+        fcns = {'sw1': lambda t: sawtooth(t, 6, 0, 5),
+                'sw2': wave_array(ts, 6, 3, 7)}
+        for size in [1, 0.1]:
+            expected = generic_workload(fcns, size=size, duration=2,
+                                        timesteps=12)
+            soa = generic_workload_soa(fcns, size=size, duration=2,
+                                       timesteps=12)
+            self.assertEqual(len(soa.t_offsets), len(expected) + 1)
+            for t, requests in enumerate(expected):
+                lo, hi = soa.t_offsets[t], soa.t_offsets[t + 1]
+                self.assertEqual(
+                    zip([soa.switches[i] for i in soa.sw_ids[lo:hi]],
+                        soa.sizes[lo:hi], soa.durations[lo:hi]),
+                    requests)
+
+
+if __name__ == '__main__':
+    unittest.main()